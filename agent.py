@@ -1,12 +1,79 @@
 import os
 import sys
 import json
+import asyncio
+import logging
+import importlib.util
 import requests
 import re
 import time
+import random
 import difflib
-from pydantic import ValidationError
-from schemas import RefinementPlan
+import hashlib
+import functools
+from pathlib import Path
+from schemas import RefinementPlan, REFINEMENT_PLAN_RESPONSE_SCHEMA, parse_plan
+from response_cache import ResponseCache
+
+try:
+    import httpx
+except ImportError:  # Without httpx, API calls go through the synchronous requests path.
+    httpx = None
+
+try:
+    import orjson
+except ImportError:  # Without orjson, payloads are serialized with the standard json module.
+    orjson = None
+
+try:
+    import msgspec
+    from schemas_msgspec import REFINEMENT_PLAN_DECODER
+except ImportError:  # Without msgspec, refinement plans are validated by Pydantic alone.
+    msgspec = None
+
+def _json_dumps(obj, sort_keys=False):
+    """Serializes `obj` straight to UTF-8 JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(obj, sort_keys=sort_keys).encode('utf-8')
+
+def _json_loads(data):
+    """
+    Parses JSON from bytes or str, using orjson when it is installed. orjson's decode
+    error subclasses json.JSONDecodeError, so callers catch the same exception either way.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+log = logging.getLogger(__name__)
+
+# Interned so the per-cycle verdict check can short-circuit on identity.
+_VERDICT_DONE = sys.intern("NO_FURTHER_IMPROVEMENTS_NEEDED")
+
+# HTTP statuses worth retrying; anything else (bad request, auth, quota config) fails the same way again.
+_RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+_MAX_BACKOFF_SECONDS = 60
+
+def _backoff_delay(attempt, retry_after=None):
+    """
+    Seconds to wait before retrying, plus jitter: the server's Retry-After if numeric, else
+    capped exponential backoff. Returns None when the server asks for a longer wait than
+    `_MAX_BACKOFF_SECONDS`, since retrying any earlier would only be rejected again.
+    """
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            pass  # An HTTP-date Retry-After; fall back to the exponential delay.
+        else:
+            if delay > _MAX_BACKOFF_SECONDS:
+                return None
+            return max(delay, 0) + random.uniform(0, 0.5)
+    return min(2 ** attempt, _MAX_BACKOFF_SECONDS) + random.uniform(0, 0.5)
+
+# Pattern used on every refinement cycle, compiled once at import.
+_JSON_RE = re.compile(r'```(?:json)?\s*\n([\s\S]*?)\n```', re.DOTALL)
 
 class SynthesisAgent:
     """
@@ -27,8 +94,51 @@ class SynthesisAgent:
         model_name = self.config['model_config']['model_name']
         self.api_url = self.config['model_config']['api_endpoint'].format(model_name=model_name)
         self.headers = {"Content-Type": "application/json", "X-goog-api-key": self.api_key}
+        # Server-sent-events variant of the endpoint, used when streaming is enabled.
+        self.stream_url = None
+        if self.config['model_config'].get('stream') and ':generateContent' in self.api_url:
+            self.stream_url = self.api_url.replace(':generateContent', ':streamGenerateContent') + '?alt=sse'
         
         self.safety_settings = self.config.get('model_config', {}).get('safety_settings')
+        # Constrain refinement plans to the RefinementPlan schema at generation time.
+        self.structured_output = self.config['model_config'].get('structured_output', False)
+        # Request keys that never change between calls, built once and shared by every payload.
+        self._payload_template = {"safetySettings": self.safety_settings} if self.safety_settings else {}
+        self._generation_config_template = {"topP": 0.95, "thinkingConfig": {"thinkingBudget": 32768}}
+        
+        # A single pooled client keeps the TLS connection alive across all cycles.
+        self._client = None
+        if httpx is not None:
+            self._client = httpx.AsyncClient(
+                http2=importlib.util.find_spec("h2") is not None,
+                limits=httpx.Limits(max_keepalive_connections=16),
+                timeout=httpx.Timeout(120),
+            )
+        
+        # The fixed system prompt can be registered once as cached content and referenced by
+        # name. Only worth it (and only accepted by the API) above a minimum token count,
+        # estimated here at ~4 characters per token.
+        context_cache = self.config['model_config'].get('context_cache', {})
+        self.context_cache_ttl = context_cache.get('ttl_seconds', 3600)
+        self.api_base_url = self.api_url.rsplit('/models/', 1)[0]
+        self._use_context_cache = (
+            self._client is not None
+            and context_cache.get('enabled', False)
+            and len(self.prompts['system_expert']) // 4 >= context_cache.get('min_tokens', 4096)
+        )
+        self._context_cache = None  # (name, monotonic refresh deadline)
+        # Created on first use: before Python 3.10, asyncio.Lock binds to the loop current at
+        # construction, which is not the one asyncio.run starts later.
+        self._context_cache_lock = None
+        
+        # Deterministic (low-temperature) responses are reused for identical requests.
+        cache_config = self.config.get('cache_config', {})
+        self._cache = ResponseCache(cache_config['cache_dir']) if cache_config.get('enabled') else None
+        self._cache_max_temperature = cache_config.get('max_temperature', 0.2)
+        # Keys already answered in this run. The cache only replays work from earlier runs (e.g. a
+        # resumed draft or first review); a repeated prompt within a run must reach the model again,
+        # or an unchanged document would get the same cached verdict and count it as a second review.
+        self._served_keys = set()
         
         if self.config['debugging']['debug_mode']:
             self.debug_log_dir = self.config['debugging']['log_directory']
@@ -36,23 +146,45 @@ class SynthesisAgent:
             print(f"DEBUG MODE ENABLED: Raw LLM responses will be saved to '{self.debug_log_dir}'")
         
         self.synthesis_step = 0
+        # Section offsets of the current document, kept up to date across cycles.
+        self._sections = None
+        self._parsed_document = None
+        # Checkpoint write running in a worker thread while the next API call proceeds.
+        self._pending_checkpoint = None
+        # Checkpoints are a base snapshot plus a log of line deltas, compacted every few saves.
+        self._patches_path = f"{self.checkpoint_path}.patches.jsonl"
+        self._checkpoint_lines = None
+        self._checkpoint_patch_count = 0
+        self.checkpoint_compaction_interval = self.config['synthesis_config'].get('checkpoint_compaction_interval', 10)
+        # Documents estimated above this many tokens are reviewed a few sections at a time.
+        self.review_token_budget = self.config['synthesis_config'].get('review_token_budget')
+        self._review_round = 0
+        self._section_reviewed_at = {}  # title -> review round in which it was last sent
+        self._last_finding_locations = set()
+        self._problem_terms = None
 
     def _load_prompts(self):
         """Loads all necessary prompts from the 'prompts' directory."""
         prompt_files = ["system_expert_prompt.txt", "initial_synthesis_prompt.txt", "iterative_refinement_prompt.txt"]
         prompts = {}
         for filename in prompt_files:
+            path = os.path.join("prompts", filename)
             try:
-                with open(os.path.join("prompts", filename), 'r', encoding='utf-8') as f:
-                    # --- CORRECTION IS HERE ---
-                    # We access the first element of the tuple returned by os.path.splitext
-                    key = os.path.splitext(filename)[0].replace('_prompt', '')
-                    prompts[key] = f.read()
+                # --- CORRECTION IS HERE ---
+                # We access the first element of the tuple returned by os.path.splitext
+                key = os.path.splitext(filename)[0].replace('_prompt', '')
+                prompts[key] = self._read_prompt(path, os.stat(path).st_mtime_ns)
             except FileNotFoundError:
                 print(f"Error: Prompt file not found at 'prompts/{filename}'")
                 sys.exit(1)
         return prompts
 
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def _read_prompt(path, mtime):
+        """Reads a prompt file. Memoized per (path, mtime), so agents built later reuse it until the file changes."""
+        return Path(path).read_text(encoding='utf-8')
+
     def _save_debug_log(self, step_name, response_text):
         """Saves the raw LLM response to a file if debug mode is active."""
         if not self.config['debugging']['debug_mode']:
@@ -68,89 +200,417 @@ class SynthesisAgent:
         except IOError as e:
             print(f"  -> Warning: Could not save debug log. Error: {e}")
 
-    def _call_api(self, system_prompt, user_prompt, temperature=None, response_mime_type=None, retries=3):
-        """Sends a request to the Gemini API, using settings from config."""
+    def _build_payload(self, system_prompt, user_prompt, temperature=None, response_mime_type=None,
+                       response_schema=None, cached_content=None, candidate_count=1):
+        """
+        Builds the generateContent request body, using settings from config. With
+        `cached_content`, the system prompt is referenced by that cache name instead;
+        `candidate_count` above 1 asks for that many independent candidates in one response.
+        """
         temp = temperature if temperature is not None else self.config['model_config']['temperature']
         
+        # Only the per-call keys are filled in; the fixed ones are shared from the templates.
+        generation_config = {**self._generation_config_template, "temperature": temp}
+        if response_mime_type:
+            generation_config['responseMimeType'] = response_mime_type
+        if response_schema:
+            generation_config['responseSchema'] = response_schema
+        if candidate_count > 1:
+            generation_config['candidateCount'] = candidate_count
+        
         payload = {
-            "systemInstruction": {"parts": [{"text": system_prompt}]},
+            **self._payload_template,
             "contents": [{"role": "user", "parts": [{"text": user_prompt}]}],
-            "generationConfig": {
-                "temperature": temp,
-                "topP": 0.95,
-                "thinkingConfig": {"thinkingBudget": 32768}
-            },
+            "generationConfig": generation_config,
         }
+        if cached_content:
+            payload['cachedContent'] = cached_content
+        else:
+            payload['systemInstruction'] = {"parts": [{"text": system_prompt}]}
+        return payload
+
+    def _extract_response_texts(self, response_data):
+        """
+        Returns the concatenated text parts of every candidate, ordered by candidate index,
+        reporting blocked or empty responses. Always returns at least one (possibly empty) text.
+        """
+        if not response_data.get('candidates'):
+            prompt_feedback = response_data.get('promptFeedback', {})
+            block_reason = prompt_feedback.get('blockReason')
+            if block_reason:
+                print(f"API ERROR: The prompt was blocked. Reason: '{block_reason}'.")
+            else:
+                print(f"API Warning: Response is empty, no candidates found. Full response: {response_data}")
+            return [""]
+
+        candidates = sorted(response_data['candidates'], key=lambda c: c.get('index', 0))
+        return [self._candidate_text(candidate) for candidate in candidates]
+
+    def _candidate_text(self, candidate):
+        """Concatenates the text parts of one candidate, reporting why it is empty if so."""
+        if 'content' in candidate and 'parts' in candidate['content']:
+            texts = [p.get('text', '') for p in candidate['content']['parts'] if 'text' in p]
+            return ''.join(texts)
+        else:
+            finish_reason = candidate.get('finishReason', 'UNKNOWN')
+            print(f"API Warning: Received an empty content response. Finish Reason: '{finish_reason}'.")
+            if finish_reason == 'SAFETY':
+                print("This is likely due to the safety filters. You can adjust them in config.yaml.")
+            print(f"Full candidate object: {candidate}")
+            return ""
+
+    def _call_api(self, system_prompt, user_prompt, temperature=None, response_mime_type=None,
+                  response_schema=None, retries=3):
+        """Sends a blocking request to the Gemini API. Used as a fallback when httpx is unavailable."""
+        payload = self._build_payload(system_prompt, user_prompt, temperature, response_mime_type, response_schema)
+        texts = self._post(payload, retries)
+        return texts[0] if texts is not None else None
+
+    def _post(self, payload, retries):
+        """
+        Posts a payload with `requests`, retrying network errors and retryable HTTP statuses
+        with backoff. Returns the text of each candidate, or None if the call failed.
+        """
+        body = _json_dumps(payload)
+        for attempt in range(retries):
+            try:
+                response = requests.post(self.api_url, headers=self.headers, data=body)
+                response.raise_for_status()
+                return self._extract_response_texts(_json_loads(response.content))
+
+            except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+                # A non-JSON body (e.g. a proxy error page) is retried like a network error.
+                print(f"API Network Error (Attempt {attempt + 1}/{retries}): {e}")
+                retry_after = None
+                if getattr(e, 'response', None) is not None:
+                    try:
+                        print(f"Error Body: {e.response.json()}")
+                    except json.JSONDecodeError:
+                        print(f"Error Body: {e.response.text}")
+                    if e.response.status_code not in _RETRYABLE_STATUS_CODES:
+                        print(f"API call failed with non-retryable status {e.response.status_code}.")
+                        return None
+                    retry_after = e.response.headers.get('Retry-After')
+                if attempt + 1 < retries:
+                    delay = _backoff_delay(attempt, retry_after)
+                    if delay is None:
+                        print(f"API call failed: the server asked to retry after {retry_after} seconds.")
+                        return None
+                    time.sleep(delay)
         
-        if self.safety_settings:
-            payload['safetySettings'] = self.safety_settings
-        if response_mime_type:
-            payload['generationConfig']['responseMimeType'] = response_mime_type
+        print("API call failed after multiple retries.")
+        return None
+
+    def _request_key(self, system_prompt, user_prompt, temperature, response_mime_type, response_schema=None,
+                     sample=0, candidate_count=1):
+        """
+        Hashes everything that determines a response into a key for the response cache.
+        `sample` tells apart requests that are meant to be independent samples of the
+        same prompt (review fan-out).
+        """
+        request = {
+            "model": self.config['model_config']['model_name'],
+            "system": system_prompt,
+            "user": user_prompt,
+            "temperature": temperature,
+            "response_mime_type": response_mime_type,
+            "response_schema": response_schema,
+            "sample": sample,
+            "candidate_count": candidate_count,
+        }
+        return hashlib.sha256(_json_dumps(request, sort_keys=True)).hexdigest()
+
+    def _discard_cached_response(self, system_prompt, user_prompt, temperature=None, response_mime_type=None,
+                                 response_schema=None, sample=0, candidate_count=1):
+        """Evicts a cached response that turned out to be unusable, so the next call hits the API."""
+        if self._cache is None:
+            return
+        temp = temperature if temperature is not None else self.config['model_config']['temperature']
+        self._cache.delete(self._request_key(
+            system_prompt, user_prompt, temp, response_mime_type, response_schema, sample, candidate_count
+        ))
+
+    async def _acall_api(self, system_prompt, user_prompt, temperature=None, response_mime_type=None,
+                         response_schema=None, retries=3, sample=0):
+        """
+        Sends a request to the Gemini API. Deterministic requests are answered from the
+        response cache.
+        """
+        texts = await self._acall_api_candidates(
+            system_prompt, user_prompt, temperature, response_mime_type, response_schema, retries, sample
+        )
+        return texts[0] if texts is not None else None
+
+    async def _acall_api_candidates(self, system_prompt, user_prompt, temperature=None, response_mime_type=None,
+                                    response_schema=None, retries=3, sample=0, candidate_count=1):
+        """
+        Like `_acall_api`, but asks for `candidate_count` candidates in one round and returns
+        the text of each of them, or None if the call failed.
+        """
+        temp = temperature if temperature is not None else self.config['model_config']['temperature']
+        key = self._request_key(
+            system_prompt, user_prompt, temp, response_mime_type, response_schema, sample, candidate_count
+        )
+        return await self._fetch_response(
+            key, system_prompt, user_prompt, temp, response_mime_type, response_schema, retries, candidate_count
+        )
+
+    async def _fetch_response(self, key, system_prompt, user_prompt, temperature, response_mime_type, response_schema,
+                              retries, candidate_count=1):
+        """
+        Answers from the response cache when allowed and the key has not been served yet in
+        this run, otherwise calls the API and caches the result.
+        """
+        cacheable = self._cache is not None and temperature <= self._cache_max_temperature
+        if cacheable and key not in self._served_keys:
+            cached = self._cache.get(key)
+            if cached:
+                print("  -> Using cached API response.")
+                self._served_keys.add(key)
+                return _json_loads(cached)
+
+        if self._client is None:
+            payload = self._build_payload(
+                system_prompt, user_prompt, temperature, response_mime_type, response_schema,
+                candidate_count=candidate_count
+            )
+            texts = await asyncio.to_thread(self._post, payload, retries)
+        else:
+            cached_content = await self._cached_system_prompt(system_prompt)
+            payload = self._build_payload(
+                system_prompt, user_prompt, temperature, response_mime_type, response_schema, cached_content,
+                candidate_count
+            )
+            texts = await self._apost(payload, retries)
         
+        if cacheable and texts and any(texts):
+            self._cache.set(key, _json_dumps(texts).decode('utf-8'))
+            self._served_keys.add(key)
+        return texts
+
+    async def _apost(self, payload, retries):
+        """
+        Posts a payload over the pooled async client, retrying network errors and retryable
+        HTTP statuses with backoff. Returns the text of each candidate, or None if the call failed.
+        """
+        body = _json_dumps(payload)
         for attempt in range(retries):
             try:
-                response = requests.post(self.api_url, headers=self.headers, data=json.dumps(payload))
+                if self.stream_url:
+                    return await self._apost_stream(body)
+                response = await self._client.post(self.api_url, headers=self.headers, content=body)
                 response.raise_for_status()
-                response_data = response.json()
-                
-                if not response_data.get('candidates'):
-                    prompt_feedback = response_data.get('promptFeedback', {})
-                    block_reason = prompt_feedback.get('blockReason')
-                    if block_reason:
-                        print(f"API ERROR: The prompt was blocked. Reason: '{block_reason}'.")
-                    else:
-                        print(f"API Warning: Response is empty, no candidates found. Full response: {response_data}")
-                    return ""
-
-                candidate = response_data['candidates'][0]
-                if 'content' in candidate and 'parts' in candidate['content']:
-                    texts = [p.get('text', '') for p in candidate['content']['parts'] if 'text' in p]
-                    return ''.join(texts)
-                else:
-                    finish_reason = candidate.get('finishReason', 'UNKNOWN')
-                    print(f"API Warning: Received an empty content response. Finish Reason: '{finish_reason}'.")
-                    if finish_reason == 'SAFETY':
-                        print("This is likely due to the safety filters. You can adjust them in config.yaml.")
-                    print(f"Full candidate object: {candidate}")
-                    return ""
-
-            except requests.exceptions.RequestException as e:
+                return self._extract_response_texts(_json_loads(response.content))
+
+            except (httpx.HTTPError, json.JSONDecodeError) as e:
                 print(f"API Network Error (Attempt {attempt + 1}/{retries}): {e}")
-                if hasattr(e, 'response') and e.response is not None:
+                retry_after = None
+                if isinstance(e, httpx.HTTPStatusError):
                     try:
                         print(f"Error Body: {e.response.json()}")
                     except json.JSONDecodeError:
                         print(f"Error Body: {e.response.text}")
-                time.sleep(2 ** attempt)
+                    if e.response.status_code not in _RETRYABLE_STATUS_CODES:
+                        print(f"API call failed with non-retryable status {e.response.status_code}.")
+                        return None
+                    retry_after = e.response.headers.get('Retry-After')
+                if attempt + 1 < retries:
+                    delay = _backoff_delay(attempt, retry_after)
+                    if delay is None:
+                        print(f"API call failed: the server asked to retry after {retry_after} seconds.")
+                        return None
+                    await asyncio.sleep(delay)
         
         print("API call failed after multiple retries.")
         return None
+
+    async def _apost_stream(self, body):
+        """Streams the response as server-sent events, accumulating text parts per candidate while the model decodes."""
+        texts = {}
+        last_chunk = {}
+        async with self._client.stream("POST", self.stream_url, headers=self.headers, content=body) as response:
+            if response.is_error:
+                await response.aread()
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                last_chunk = _json_loads(line[6:])
+                for candidate in last_chunk.get('candidates', []):
+                    parts = candidate.get('content', {}).get('parts', [])
+                    texts.setdefault(candidate.get('index', 0), []).extend(p['text'] for p in parts if 'text' in p)
+        
+        if any(texts.values()):
+            return [''.join(texts.get(index, [])) for index in range(max(texts) + 1)]
+        # Nothing was generated; let the last event report the block or finish reason.
+        return self._extract_response_texts(last_chunk)
+
+    async def _cached_system_prompt(self, system_prompt):
+        """
+        Returns the cachedContents name holding the system prompt, creating it on first use
+        and again once its TTL runs out. Returns None when the prompt is sent inline instead.
+        """
+        if not self._use_context_cache or system_prompt != self.prompts['system_expert']:
+            return None
+        
+        if self._context_cache_lock is None:
+            self._context_cache_lock = asyncio.Lock()
+        async with self._context_cache_lock:
+            if self._context_cache and time.monotonic() < self._context_cache[1]:
+                return self._context_cache[0]
+            
+            body = {
+                "model": f"models/{self.config['model_config']['model_name']}",
+                "systemInstruction": {"parts": [{"text": system_prompt}]},
+                "ttl": f"{self.context_cache_ttl}s",
+            }
+            try:
+                response = await self._client.post(
+                    f"{self.api_base_url}/cachedContents", headers=self.headers, content=_json_dumps(body)
+                )
+                response.raise_for_status()
+                name = _json_loads(response.content)['name']
+            except (httpx.HTTPError, json.JSONDecodeError, KeyError) as e:
+                print(f"  -> Warning: Could not cache the system prompt; sending it inline from now on. Error: {e}")
+                self._use_context_cache = False
+                return None
+            
+            # Refresh a little before the server-side expiry so requests never reference a dead cache.
+            self._context_cache = (name, time.monotonic() + max(self.context_cache_ttl - 60, 0))
+            print(f"  -> System prompt registered as cached content '{name}'.")
+            return name
+
+    async def _delete_context_cache(self):
+        """Deletes the cached system prompt so it stops accruing storage time."""
+        if not self._context_cache:
+            return
+        name, _ = self._context_cache
+        self._context_cache = None
+        try:
+            response = await self._client.delete(f"{self.api_base_url}/{name}", headers=self.headers)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"  -> Warning: Could not delete cached content '{name}'; it expires on its own. Error: {e}")
+
+    async def aclose(self):
+        """
+        Waits for any pending checkpoint write, deletes the cached system prompt, then
+        closes the pooled HTTP client and the response cache.
+        """
+        await self._flush_checkpoint()
+        if self._client is not None:
+            await self._delete_context_cache()
+            await self._client.aclose()
+        if self._cache is not None:
+            self._cache.close()
     
     def _save_checkpoint(self, document_content):
-        """Saves the current state of the document to the checkpoint file."""
+        """
+        Saves the current state of the document. Usually only the line delta against the
+        previous save is appended to the patch log; every `checkpoint_compaction_interval`
+        saves the full document is written as a new base instead. Runs in a worker thread,
+        so it returns the status message for the event loop to print instead of printing it.
+        """
+        new_lines = document_content.splitlines(keepends=True)
         try:
-            with open(self.checkpoint_path, 'w', encoding='utf-8') as f:
-                f.write(document_content)
-            print(f"  -> Checkpoint saved successfully to {self.checkpoint_path}")
+            if self._checkpoint_lines is None or self._checkpoint_patch_count >= self.checkpoint_compaction_interval:
+                self._write_checkpoint_base(document_content)
+            else:
+                matcher = difflib.SequenceMatcher(None, self._checkpoint_lines, new_lines)
+                delta = [[i1, i2, new_lines[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+                with open(self._patches_path, 'a', encoding='utf-8') as f:
+                    f.write(_json_dumps(delta).decode('utf-8') + '\n')
+                self._checkpoint_patch_count += 1
+            self._checkpoint_lines = new_lines
+            return f"  -> Checkpoint saved successfully to {self.checkpoint_path}"
         except IOError as e:
-            print(f"  -> Warning: Could not save checkpoint. Error: {e}")
+            return f"  -> Warning: Could not save checkpoint. Error: {e}"
+
+    def _write_checkpoint_base(self, document_content):
+        """Writes the full document as the checkpoint base, atomically via a temporary file, and resets the patch log."""
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        # newline='' keeps the text byte-exact, since patches address it by line index.
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(document_content)
+        # The old patches only apply to the old base, so drop them before swapping it in.
+        open(self._patches_path, 'w', encoding='utf-8').close()
+        os.replace(tmp_path, self.checkpoint_path)
+        self._checkpoint_patch_count = 0
+
+    def compact_checkpoint(self, document_content):
+        """
+        Rewrites the checkpoint as a single full snapshot of `document_content`, so the
+        checkpoint file alone holds the latest document. Returns True on success.
+        """
+        try:
+            self._write_checkpoint_base(document_content)
+        except IOError as e:
+            print(f"  -> Warning: Could not write a full checkpoint. Error: {e}")
+            return False
+        self._checkpoint_lines = document_content.splitlines(keepends=True)
+        return True
+
+    async def _schedule_checkpoint(self, document_content):
+        """Starts saving a checkpoint in a worker thread, after the previous write, so disk I/O overlaps the next API call."""
+        await self._flush_checkpoint()
+        self._pending_checkpoint = asyncio.create_task(asyncio.to_thread(self._save_checkpoint, document_content))
+
+    async def _flush_checkpoint(self):
+        """Waits until the pending checkpoint write, if any, has finished and reports its outcome."""
+        if self._pending_checkpoint is not None:
+            message = await self._pending_checkpoint
+            self._pending_checkpoint = None
+            print(message)
 
     def _load_from_checkpoint(self):
-        """Loads the document from a checkpoint file if it exists."""
-        if os.path.exists(self.checkpoint_path):
-            print(f"Checkpoint file found at '{self.checkpoint_path}'. Resuming progress.")
-            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        return None
+        """Loads the document from a checkpoint file if it exists, replaying its patch log on top."""
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8', newline='') as f:
+                lines = f.read().splitlines(keepends=True)
+        except FileNotFoundError:
+            return None
+        print(f"Checkpoint file found at '{self.checkpoint_path}'. Resuming progress.")
+        
+        patch_count = 0
+        try:
+            with open(self._patches_path, 'r', encoding='utf-8') as f:
+                for entry in f:
+                    try:
+                        delta = _json_loads(entry)
+                    except json.JSONDecodeError:
+                        print("  -> Warning: Ignoring a truncated checkpoint patch.")
+                        break
+                    # Opcodes refer to the previous state, so apply them back to front.
+                    for i1, i2, replacement in reversed(delta):
+                        lines[i1:i2] = replacement
+                    patch_count += 1
+        except FileNotFoundError:
+            pass  # No delta has been saved since the base was written.
+        
+        self._checkpoint_lines = lines
+        self._checkpoint_patch_count = patch_count
+        return ''.join(lines)
 
-    def _generate_initial_draft(self):
+    def clear_checkpoint(self):
+        """Removes the checkpoint base and its patch log once the final document is safely written."""
+        removed = False
+        for path in (self.checkpoint_path, self._patches_path):
+            try:
+                os.remove(path)
+                removed = True
+            except FileNotFoundError:
+                pass
+        if removed:
+            print("Checkpoint file removed.")
+
+    async def _generate_initial_draft(self):
         """Generates the first complete draft of the document."""
         print("Generating initial draft...")
         user_prompt = self.prompts['initial_synthesis'].format(
             language=self.language,
             problem_statement=self.problem_statement
         )
-        draft = self._call_api(self.prompts['system_expert'], user_prompt)
+        draft = await self._acall_api(self.prompts['system_expert'], user_prompt)
         if draft:
             self._save_debug_log("initial_draft", draft)
             print("Initial draft generated successfully.")
@@ -159,30 +619,92 @@ class SynthesisAgent:
             sys.exit(1)
         return draft
 
-    def _request_refinement_plan(self, document_content):
-        """Asks the LLM to act as a peer reviewer, providing the original task context."""
+    async def _request_refinement_plans(self, review_content, sample=0, candidate_count=1):
+        """
+        Asks the LLM to act as a peer reviewer of `review_content` (the document, or its
+        excerpt for this round), providing the original task context.
+        Returns a list of (plan_raw, refinement_plan) pairs, one per candidate; a plan is
+        None if its response is unusable. `sample` distinguishes concurrent reviews of the
+        same document, and `candidate_count` requests several reviews in a single call.
+        """
         print("Requesting context-aware peer review and refinement plan from LLM...")
         user_prompt = self.prompts['iterative_refinement'].format(
             problem_statement=self.problem_statement,
-            document_content=document_content,
+            document_content=review_content,
             language=self.language
         )
-        plan_raw = self._call_api(
-            self.prompts['system_expert'],
-            user_prompt,
-            temperature=0.2,
-            response_mime_type="application/json"
-        )
-        if plan_raw is not None:
-            self._save_debug_log("refinement_plan", plan_raw)
+        request_options = {
+            "temperature": 0.2,
+            "response_mime_type": "application/json",
+            "response_schema": REFINEMENT_PLAN_RESPONSE_SCHEMA if self.structured_output else None,
+            "sample": sample,
+            "candidate_count": candidate_count,
+        }
+        plans_raw = await self._acall_api_candidates(self.prompts['system_expert'], user_prompt, **request_options)
+        if not plans_raw:
+            return [(None, None)]
+        
+        reviews = []
+        for plan_raw in plans_raw:
+            refinement_plan = None
             if plan_raw:
+                self._save_debug_log("refinement_plan", plan_raw)
                 print("Refinement plan (raw) received.")
-        return plan_raw
+                refinement_plan = self._parse_refinement_plan(plan_raw)
+            reviews.append((plan_raw, refinement_plan))
+        if all(refinement_plan is None for _, refinement_plan in reviews):
+            self._discard_cached_response(self.prompts['system_expert'], user_prompt, **request_options)
+        return reviews
+
+    def _review_excerpt(self, document):
+        """
+        Returns (content, omitted, selected): the document as it should be sent for review,
+        the titles of the sections left out and those sent in full. Within `review_token_budget`, sections named in the
+        last findings come first, then those reviewed least recently, then those sharing
+        the most terms with the problem statement; the rest keep only their header and a
+        placeholder, so the reviewer still sees the document's structure.
+        """
+        if not self.review_token_budget or len(document) // 4 <= self.review_token_budget:
+            return document, frozenset(), frozenset()
+        sections = self._document_sections(document)
+        if not sections:
+            return document, frozenset(), frozenset()
+
+        if self._problem_terms is None:
+            self._problem_terms = set(re.findall(r"\w{4,}", self.problem_statement.lower()))
+
+        def priority(title):
+            start, end = sections[title]
+            terms = set(re.findall(r"\w{4,}", document[start:end].lower()))
+            overlap = len(terms & self._problem_terms) / max(1, len(self._problem_terms))
+            return (title not in self._last_finding_locations, self._section_reviewed_at.get(title, -1), -overlap)
+
+        ordered = sorted(sections.items(), key=lambda item: item[1][0])
+        first_body_start = ordered[0][1][0]
+        preamble = document[:document.rfind('\n', 0, first_body_start - 1) + 1]
+        budget = self.review_token_budget - len(preamble) // 4
+        selected = set()
+        for title in sorted(sections, key=priority):
+            start, end = sections[title]
+            cost = (end - start) // 4
+            if selected and cost > budget:
+                continue
+            selected.add(title)
+            budget -= cost
+
+        parts = [preamble]
+        for title, (start, end) in ordered:
+            if title in selected:
+                parts.append(f"## {title}\n{document[start:end]}")
+            else:
+                parts.append(f"## {title}\n[Section omitted from this review to save tokens. Do not rewrite it.]\n\n")
+        omitted = frozenset(sections) - selected
+        print(f"  -> Reviewing {len(selected)}/{len(sections)} sections within the token budget.")
+        return "".join(parts), omitted, frozenset(selected)
 
     def _extract_json_from_markdown(self, text):
         """Extracts JSON content enclosed in markdown code blocks."""
-        json_pattern = re.compile(r'```(?:json)?\s*\n([\s\S]*?)\n```', re.DOTALL)
-        match = json_pattern.search(text)
+        match = _JSON_RE.search(text)
         if match:
             return match.group(1).strip()
         
@@ -192,39 +714,162 @@ class SynthesisAgent:
         
         return None
 
-    def _apply_refinements(self, document, refinement_plan: RefinementPlan):
-        """Applies the refined sections from the Pydantic plan to the document."""
+    def _parse_refinement_plan(self, plan_raw):
+        """
+        Validates a refinement plan, returning None if the response is unusable.
+        JSON-mode responses are almost always bare JSON, so the raw text is validated
+        first and the markdown extraction only runs when that fails.
+        """
+        try:
+            return self._validate_refinement_plan(plan_raw)
+        except ValueError as e:
+            error = e
+        
+        plan_json_str = self._extract_json_from_markdown(plan_raw)
+        if not plan_json_str:
+            print("❌ ERROR: LLM response did not contain a parseable JSON structure.")
+            return None
+        if plan_json_str != plan_raw.strip():
+            try:
+                return self._validate_refinement_plan(plan_json_str)
+            except ValueError as e:
+                error = e
+        
+        print(f"\n❌ CRITICAL PARSING ERROR: LLM response did not match Pydantic schema.")
+        print(f"Validation Errors: {error}")
+        return None
+
+    def _validate_refinement_plan(self, plan_json_str):
+        """
+        Decodes and validates plan JSON, raising ValueError (a pydantic ValidationError
+        when the JSON does not match the schema) if it is unusable.
+        """
+        if msgspec is not None:
+            try:
+                return REFINEMENT_PLAN_DECODER.decode(plan_json_str)
+            except msgspec.DecodeError:
+                pass  # Pydantic below reports exactly what does not match.
+        return parse_plan(plan_json_str)
+
+    async def _review_document(self, document):
+        """
+        Requests `review_fanout` reviews and returns the first valid plan, cancelling the
+        rest. With `review_batching` they arrive as candidates of a single call; otherwise
+        they are concurrent calls. All of them review the same excerpt, built once per round.
+        Returns (plan, omitted, received): `omitted` holds the sections the reviewer only saw
+        as placeholders, and `received` tells whether any non-empty response arrived at all.
+        """
+        self._review_round += 1
+        review_content, omitted, selected = self._review_excerpt(document)
+        synthesis_config = self.config['synthesis_config']
+        fanout = max(1, synthesis_config.get('review_fanout', 1))
+        if fanout > 1 and synthesis_config.get('review_batching', False):
+            reviews = [self._request_refinement_plans(review_content, candidate_count=fanout)]
+        else:
+            reviews = [self._request_refinement_plans(review_content, sample) for sample in range(fanout)]
+        tasks = [asyncio.ensure_future(review) for review in reviews]
+        received = False
+        try:
+            for next_review in asyncio.as_completed(tasks):
+                for plan_raw, refinement_plan in await next_review:
+                    if not plan_raw:
+                        continue
+                    received = True
+                    if refinement_plan is not None:
+                        # Only a review that came back counts towards rotating sections through the excerpt.
+                        for title in selected:
+                            self._section_reviewed_at[title] = self._review_round
+                        return refinement_plan, omitted, received
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return None, omitted, received
+
+    def _parse_sections(self, document):
+        """
+        Scans the document once and maps each '## ' section title to the (start, end)
+        offsets of its body, so sections can be spliced without rebuilding the document.
+        """
+        sections = {}
+        current_title, body_start = None, 0
+        position = 0
+        while position < len(document):
+            line_end = document.find('\n', position)
+            line_end = len(document) if line_end == -1 else line_end + 1
+            if document.startswith('## ', position):
+                if current_title is not None:
+                    sections[current_title] = (body_start, position)
+                current_title, body_start = document[position + 3:line_end].strip(), line_end
+            position = line_end
+        if current_title is not None:
+            sections[current_title] = (body_start, len(document))
+        return sections
+
+    def _document_sections(self, document):
+        """Returns the section offsets of `document`, parsing it only if it is not the one already tracked."""
+        if self._sections is None or document is not self._parsed_document:
+            self._sections, self._parsed_document = self._parse_sections(document), document
+        return self._sections
+
+    def _apply_refinements(self, document, refinement_plan: RefinementPlan, omitted=frozenset()):
+        """
+        Applies the refined sections from the Pydantic plan to the document, splicing
+        only the changed section bodies and leaving the rest of the text untouched.
+        Sections in `omitted` were only seen as placeholders by the reviewer and are kept.
+        The tracked section offsets are shifted in place rather than reparsed.
+        """
         if not refinement_plan.refined_sections:
             print("No sections were rewritten in this cycle.")
             return document, False
 
-        original_sections = {}
-        section_pattern = re.compile(r'(##\s+([^\n]+))\n([\s\S]*?)(?=\n##\s+|\Z)')
-        for match in section_pattern.finditer(document):
-            title = match.group(2).strip()
-            content = match.group(3).strip()
-            original_sections[title] = content
+        updates = {
+            section.section_title: section.content for section in refinement_plan.refined_sections
+            if section.content is not None and section.section_title not in omitted
+        }
+        sections = self._document_sections(document)
+
+        changes = {}
+        for title, (start, end) in sections.items():
+            if title not in updates:
+                continue
+            print(f"  - Applying update to section '{title}'.")
+            new_content = updates[title]
+            if new_content.strip() != document[start:end].strip():
+                separator = "\n\n" if end < len(document) else "\n"
+                # A header on the last line has no newline of its own to separate it from the body.
+                prefix = "\n" if start and document[start - 1] != "\n" else ""
+                changes[start] = (end, prefix, new_content + separator)
         
-        updates = {section.section_title: section.content for section in refinement_plan.refined_sections if section.content is not None}
+        if not changes:
+            return document, False
 
         new_document_parts = []
-        for title, original_content in original_sections.items():
-            new_content = updates.get(title, original_content)
-            new_document_parts.append(f"## {title}\n{new_content}\n")
-            if title in updates:
-                print(f"  - Applying update to section '{title}'.")
-        
-        new_document = "\n".join(new_document_parts)
-        changes_made = new_document.strip() != document.strip()
+        new_sections = {}
+        position, shift = 0, 0
+        for title, (start, end) in sorted(sections.items(), key=lambda item: item[1][0]):
+            if start not in changes:
+                new_sections[title] = (start + shift, end + shift)
+                continue
+            _, prefix, body = changes[start]
+            new_document_parts.append(document[position:start])
+            new_document_parts.append(prefix + body)
+            position = end
+            body_start = start + shift + len(prefix)
+            new_sections[title] = (body_start, body_start + len(body))
+            shift += len(prefix) + len(body) - (end - start)
+        new_document_parts.append(document[position:])
         
-        return new_document, changes_made
+        new_document = "".join(new_document_parts)
+        self._sections, self._parsed_document = new_sections, new_document
+        return new_document, True
 
-    def synthesize(self, max_refinements):
+    async def synthesize(self, max_refinements):
         """Main synthesis loop with Pydantic-based validation and intelligent termination."""
         document = self._load_from_checkpoint()
         if document is None:
-            document = self._generate_initial_draft()
-            if document: self._save_checkpoint(document)
+            document = await self._generate_initial_draft()
+            if document: await self._schedule_checkpoint(document)
         else:
             print("Successfully loaded document from checkpoint.")
 
@@ -235,61 +880,55 @@ class SynthesisAgent:
         for i in range(max_refinements):
             print(f"\n--- Starting Refinement Cycle {i + 1}/{max_refinements} ---")
             
-            plan_raw = None
+            refinement_plan, omitted, received = None, frozenset(), False
             for attempt in range(3):
-                plan_raw = self._request_refinement_plan(document)
-                if plan_raw:
+                refinement_plan, omitted, received = await self._review_document(document)
+                if received:
                     break
                 else:
                     print(f"  -> Empty or failed response from API. Retrying... ({attempt + 1}/3)")
-                    time.sleep(2)
+                    await asyncio.sleep(2)
 
-            if not plan_raw:
+            if not received:
                 print("Skipping refinement cycle after multiple failed attempts to get a valid response.")
                 consecutive_final_versions = 0
                 continue
             
-            plan_json_str = self._extract_json_from_markdown(plan_raw)
-
-            if not plan_json_str:
-                print("❌ ERROR: LLM response did not contain a parseable JSON structure. Retrying in next cycle.")
+            if refinement_plan is None:
+                print("❌ ERROR: No review produced a valid refinement plan. Retrying in next cycle.")
                 consecutive_final_versions = 0
                 continue
             
-            try:
-                refinement_plan = RefinementPlan.model_validate_json(plan_json_str)
-                verdict = refinement_plan.final_verdict
-                print(f"Reviewer Verdict: {verdict}")
-                print("\n--- LLM's Summary of Findings ---")
-                for finding in refinement_plan.summary_of_findings:
-                    print(f"* Location: {finding.location}, Classification: {finding.classification}")
-                    print(f"  Issue: {finding.issue}")
-                print("---------------------------------\n")
-
-                if verdict == "NO_FURTHER_IMPROVEMENTS_NEEDED":
-                    consecutive_final_versions += 1
-                    print(f"Confidence counter for completion is now {consecutive_final_versions}/{confidence_threshold}.")
-                    if consecutive_final_versions >= confidence_threshold:
-                        print("\n✅ Agent is confident in the final version. Terminating refinement.")
-                        break
-                else:
-                    consecutive_final_versions = 0
-                
-                document, changes_made = self._apply_refinements(document, refinement_plan)
-                
-                if changes_made:
-                    self._save_checkpoint(document)
-                else:
-                    print("No substantial changes were applied in this cycle.")
+            verdict = refinement_plan.final_verdict
+            print(f"Reviewer Verdict: {verdict}")
+            self._last_finding_locations = {finding.location for finding in refinement_plan.summary_of_findings}
+            if log.isEnabledFor(logging.INFO):
+                # One formatted write instead of two prints per finding.
+                findings = "".join(
+                    f"* Location: {finding.location}, Classification: {finding.classification}\n  Issue: {finding.issue}\n"
+                    for finding in refinement_plan.summary_of_findings
+                )
+                log.info("\n--- LLM's Summary of Findings ---\n%s---------------------------------\n", findings)
 
-            except ValidationError as e:
-                print(f"\n❌ CRITICAL PARSING ERROR: LLM response did not match Pydantic schema.")
-                print(f"Pydantic Validation Errors: {e}")
+            if verdict == _VERDICT_DONE:
+                consecutive_final_versions += 1
+                print(f"Confidence counter for completion is now {consecutive_final_versions}/{confidence_threshold}.")
+                if consecutive_final_versions >= confidence_threshold:
+                    print("\n✅ Agent is confident in the final version. Terminating refinement.")
+                    break
+            else:
                 consecutive_final_versions = 0
-                continue
+            
+            document, changes_made = self._apply_refinements(document, refinement_plan, omitted)
+            
+            if changes_made:
+                await self._schedule_checkpoint(document)
+            else:
+                print("No substantial changes were applied in this cycle.")
         
         if i == max_refinements - 1 and consecutive_final_versions < confidence_threshold:
              print(f"\n⚠️  Reached maximum refinement limit.")
 
+        await self._flush_checkpoint()
         print("\nSynthesis process completed.")
         return document
\ No newline at end of file
@@ -0,0 +1,53 @@
+import os
+import sqlite3
+
+class ResponseCache:
+    """
+    A two-level cache of raw LLM responses: an in-memory dict in front of a
+    SQLite table on disk, so responses survive across runs.
+    """
+    def __init__(self, cache_dir):
+        """
+        Opens (or creates) the cache database inside `cache_dir`.
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self._memory = {}
+        self._db = sqlite3.connect(os.path.join(cache_dir, "responses.sqlite3"))
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL)")
+        self._db.commit()
+
+    def get(self, key):
+        """Returns the cached response for `key`, or None on a miss."""
+        if key in self._memory:
+            return self._memory[key]
+        try:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"  -> Warning: Could not read from the response cache. Error: {e}")
+            return None
+        if row is None:
+            return None
+        self._memory[key] = row[0]
+        return row[0]
+
+    def set(self, key, response):
+        """Stores `response` under `key` in memory and on disk."""
+        self._memory[key] = response
+        try:
+            self._db.execute("INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)", (key, response))
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"  -> Warning: Could not write to the response cache. Error: {e}")
+
+    def delete(self, key):
+        """Drops `key` from both cache levels, e.g. when its response proved unusable."""
+        self._memory.pop(key, None)
+        try:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"  -> Warning: Could not update the response cache. Error: {e}")
+
+    def close(self):
+        """Closes the underlying database connection."""
+        self._db.close()
@@ -1,22 +1,78 @@
 import os
 import sys
-import argparse
-import getpass
-import yaml
-from agent import SynthesisAgent
-from schemas import RefinementPlan # Importamos el modelo Pydantic
+import json
+
+# JSON copy of config.yaml, tagged with the (mtime, size) of the file it was parsed from and
+# regenerated whenever those change. The stdlib json parser is much faster than YAML, so warm
+# starts skip the YAML parse entirely.
+CONFIG_JSON_PATH = "config.json"
+
+# Language confirmed in the last run, offered as the default answer.
+LANGUAGE_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".config", "acadsynth", "lang")
+
+# Buffer size for reading the problem statement and writing the final document.
+IO_BUFFER_SIZE = 256 * 1024
 
 def load_config():
-    """Loads configuration from config.yaml."""
+    """Loads configuration from config.yaml, through its JSON copy when that is up to date."""
+    try:
+        stat = os.stat("config.yaml")
+    except FileNotFoundError:
+        print("Error: config.yaml not found. Please ensure it exists in the project directory.")
+        sys.exit(1)
+    # Compared for equality, not ordering: copies and restores (cp -p, rsync -a, tar x)
+    # can give an edited config.yaml an older mtime than its stale JSON copy.
+    source = [stat.st_mtime_ns, stat.st_size]
+    
+    config = load_config_json(source)
+    if config is not None:
+        return config
+    
+    # yaml is only imported when config.yaml actually has to be parsed.
+    import yaml
+    # libyaml's C parser when PyYAML was built with it, the pure-Python one otherwise.
+    Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
     try:
         with open("config.yaml", 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f)
+            config = yaml.load(f, Loader=Loader)
     except FileNotFoundError:
         print("Error: config.yaml not found. Please ensure it exists in the project directory.")
         sys.exit(1)
     except yaml.YAMLError as e:
         print(f"Error parsing config.yaml: {e}")
         sys.exit(1)
+    save_config_json(source, config)
+    return config
+
+def load_config_json(source):
+    """Returns the config from config.json if it was parsed from this exact config.yaml state, otherwise None."""
+    try:
+        with open(CONFIG_JSON_PATH, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None  # Missing or corrupt copy: parse the YAML instead.
+    if not isinstance(cached, dict) or cached.get("source") != source:
+        return None
+    return cached.get("config")
+
+def save_config_json(source, config):
+    """
+    Writes config.json atomically. Configs that JSON cannot represent exactly
+    (e.g. YAML dates or non-string keys) are not copied and keep loading from YAML.
+    """
+    try:
+        serialized = json.dumps({"source": source, "config": config}, ensure_ascii=False, indent=2)
+    except (TypeError, ValueError):
+        return
+    if json.loads(serialized)["config"] != config:
+        return
+    tmp_path = f"{CONFIG_JSON_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(serialized)
+        os.replace(tmp_path, CONFIG_JSON_PATH)
+    except OSError as e:
+        print(f"  -> Warning: Could not write {CONFIG_JSON_PATH}. Error: {e}")
 
 def get_api_key_from_env():
     """Retrieves the Google API key, falling back to interactive prompt."""
@@ -27,6 +83,8 @@ def get_api_key_from_env():
     else:
         print("Environment variable GOOGLE_API_KEY not found.")
         print("Please enter your Google Gemini API key.")
+        # Only needed for the interactive prompt; getpass pulls in termios/msvcrt.
+        import getpass
         try:
             api_key = getpass.getpass("API Key: ")
             if not api_key:
@@ -40,7 +98,7 @@ def get_api_key_from_env():
 def read_file_content(filepath):
     """Reads and returns the content of a file, exiting on error."""
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
+        with open(filepath, 'r', encoding='utf-8', buffering=IO_BUFFER_SIZE) as f:
             return f.read()
     except FileNotFoundError:
         print(f"Error: File not found at '{filepath}'")
@@ -50,9 +108,18 @@ def read_file_content(filepath):
         sys.exit(1)
 
 def get_user_language_preference():
-    """Prompts the user for their preferred language with confirmation."""
+    """
+    Prompts the user for their preferred language with confirmation. The language
+    confirmed last time is offered as the default and accepted with Enter alone.
+    """
+    last_language = load_last_language()
     while True:
-        language = input("In which language do you want the response and the document? (e.g., English, Spanish): ")
+        if last_language:
+            language = input(f"In which language do you want the response and the document? [{last_language}]: ")
+            if not language.strip():
+                return last_language
+        else:
+            language = input("In which language do you want the response and the document? (e.g., English, Spanish): ")
         if not language.strip():
             print("Language cannot be empty. Please try again.")
             continue
@@ -60,13 +127,40 @@ def get_user_language_preference():
         while True:
             confirm = input(f"You have selected '{language}'. Are you sure? [y/n]: ").lower()
             if confirm in ['y', 'yes']:
+                save_last_language(language)
                 return language
             elif confirm in ['n', 'no']:
                 break
             else:
                 print("Invalid input. Please enter 'y' or 'n'.")
 
-def main():
+def load_last_language():
+    """Returns the language confirmed in a previous run, or None."""
+    try:
+        with open(LANGUAGE_CACHE_PATH, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def save_last_language(language):
+    """Remembers the confirmed language for the next run; failing to do so is not an error."""
+    try:
+        os.makedirs(os.path.dirname(LANGUAGE_CACHE_PATH), exist_ok=True)
+        with open(LANGUAGE_CACHE_PATH, 'w', encoding='utf-8') as f:
+            f.write(language)
+    except OSError as e:
+        print(f"  -> Warning: Could not remember the language choice. Error: {e}")
+
+async def run_agent(agent, max_refinements):
+    """Runs the synthesis loop and releases the agent's pooled HTTP connections."""
+    try:
+        return await agent.synthesize(max_refinements=max_refinements)
+    finally:
+        await agent.aclose()
+
+def _build_parser():
+    """Builds the command-line parser. argparse is imported here so importing this module stays light."""
+    import argparse
     parser = argparse.ArgumentParser(
         description='Academic Document Synthesizer with robust JSON parsing and intelligent termination.',
         formatter_class=argparse.RawTextHelpFormatter
@@ -75,9 +169,19 @@ def main():
     parser.add_argument('--output', '-o', default='output/final_document.md', help='Path for the final output markdown file (default: output/final_document.md)')
     # max_refinements is now controlled by config.yaml, but can be overridden by command line.
     parser.add_argument('--max-refinements', '-r', type=int, default=None, help='Maximum number of refinement cycles to perform (safeguard). Overrides config.')
-    args = parser.parse_args()
+    return parser
+
+def main():
+    args = _build_parser().parse_args()
+    # Like the agent below, imported only once the arguments are valid so that --help stays cheap.
+    import asyncio
+    import logging
 
     # --- Setup ---
+    # The agent reports review findings through logging; show them like the rest of the output
+    # without turning on INFO logs of third-party libraries (e.g. httpx request lines).
+    logging.basicConfig(format="%(message)s", stream=sys.stdout)
+    logging.getLogger("agent").setLevel(logging.INFO)
     config = load_config()
     api_key = get_api_key_from_env()
     problem_statement = read_file_content(args.problem_file)
@@ -95,22 +199,34 @@ def main():
     max_refinements = args.max_refinements if args.max_refinements is not None else config['synthesis_config']['max_refinements']
     
     # --- Agent Execution ---
+    # Imported here so that --help and argument errors do not pay for the HTTP and Pydantic stack.
+    from agent import SynthesisAgent
     agent = SynthesisAgent(problem_statement, language, api_key, checkpoint_path, config)
-    final_document = agent.synthesize(max_refinements=max_refinements)
+    final_document = asyncio.run(run_agent(agent, max_refinements))
     
     # --- Output and Cleanup ---
+    # Written next to the target and renamed over it, so a crash never leaves a truncated document.
+    tmp_output = f"{args.output}.tmp"
     try:
-        with open(args.output, 'w', encoding='utf-8') as f:
+        with open(tmp_output, 'w', encoding='utf-8', buffering=IO_BUFFER_SIZE) as f:
             f.write(final_document)
+        os.replace(tmp_output, args.output)
         print(f"\n✅ Success! The final document has been saved to: {args.output}")
 
-        if os.path.exists(checkpoint_path):
-            os.remove(checkpoint_path)
-            print("Checkpoint file removed.")
+        agent.clear_checkpoint()
             
     except IOError as e:
-        print(f"\n❌ Error: Could not write the final document. Progress is saved in {checkpoint_path}")
+        print(f"\n❌ Error: Could not write the final document.")
         print(f"Error details: {e}")
+        try:
+            os.remove(tmp_output)
+        except OSError:
+            pass  # Best effort: the original error is what matters here.
+        # The checkpoint is usually a base plus a patch log; fold it into one full copy if possible.
+        if agent.compact_checkpoint(final_document):
+            print(f"The final document is saved in {checkpoint_path}")
+        else:
+            print(f"Progress is saved in {checkpoint_path} and its patch log. Re-run the same command to resume from it.")
 
 if __name__ == "__main__":
     # Ensure main is protected by if __name__ == "__main__":
@@ -1,20 +1,44 @@
-from pydantic import BaseModel, Field
-from typing import List, Literal, Optional
+import sys
+import json
+from enum import Enum
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, field_validator
+from pydantic.dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Type, Union
 
-# Definimos un alias para los tipos de veredicto permitidos
-VerdictType = Literal[
-    "SIGNIFICANT_IMPROVEMENTS_REQUIRED",
-    "MINOR_IMPROVEMENTS_SUGGESTED",
-    "NO_FURTHER_IMPROVEMENTS_NEEDED"
-]
+try:
+    import orjson
+except ImportError:  # Sin orjson, el JSON se parsea con el módulo estándar.
+    orjson = None
 
-# Definimos un alias para los tipos de fallo permitidos
-IssueType = Literal["Critical Flaw", "Justification Gap"]
+class _StrEnum(str, Enum):
+    # Se imprime como su valor, igual que los campos validados con `use_enum_values`.
+    def __str__(self):
+        return self.value
 
-class Finding(BaseModel):
+# Definimos un enum para los tipos de veredicto permitidos
+class VerdictType(_StrEnum):
+    SIGNIFICANT_IMPROVEMENTS_REQUIRED = "SIGNIFICANT_IMPROVEMENTS_REQUIRED"
+    MINOR_IMPROVEMENTS_SUGGESTED = "MINOR_IMPROVEMENTS_SUGGESTED"
+    NO_FURTHER_IMPROVEMENTS_NEEDED = "NO_FURTHER_IMPROVEMENTS_NEEDED"
+
+# Definimos un enum para los tipos de fallo permitidos
+class IssueType(_StrEnum):
+    CRITICAL_FLAW = "Critical Flaw"
+    JUSTIFICATION_GAP = "Justification Gap"
+
+# Los enums se validan con una búsqueda por valor y los campos guardan el string plano.
+# Los planes son inmutables una vez validados; las claves desconocidas se ignoran.
+_MODEL_CONFIG = ConfigDict(use_enum_values=True, populate_by_name=True, frozen=True, extra="ignore")
+
+# `slots` en dataclasses requiere Python 3.10+.
+_DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(config=_MODEL_CONFIG, **_DATACLASS_SLOTS)
+class Finding:
     """
     Modelo para un único hallazgo en la revisión.
     Usa alias para ser más flexible con lo que el LLM genera.
+    Es el modelo más numeroso, así que se define como dataclass con `__slots__`.
     """
     location: str = Field(
         description="The standardized English section title where the issue occurs (e.g., 'Introduction')."
@@ -27,11 +51,18 @@ class Finding(BaseModel):
         description="The classification of the issue."
     )
 
+    # Los títulos estándar son un conjunto pequeño y cerrado: internados se comparan por identidad.
+    @field_validator("location")
+    @classmethod
+    def _intern_location(cls, value: str) -> str:
+        return sys.intern(value)
+
 class RefinedSection(BaseModel):
     """
     Modelo para una única sección reescrita.
     Inspirado en OpenEvolve para localizar y reemplazar contenido.
     """
+    model_config = _MODEL_CONFIG
 
     section_title: str = Field(
         description="The standardized English title of the section to be replaced (e.g., 'Discussion')."
@@ -40,11 +71,18 @@ class RefinedSection(BaseModel):
         description="The full, rewritten content for this section."
     )
 
+    @field_validator("section_title")
+    @classmethod
+    def _intern_section_title(cls, value: str) -> str:
+        return sys.intern(value)
+
 class RefinementPlan(BaseModel):
     """
     Este es el modelo Pydantic principal para la respuesta del agente refinador.
     El LLM debe generar un JSON que valide contra este modelo.
     """
+    model_config = _MODEL_CONFIG
+
     final_verdict: VerdictType = Field(
         alias="Final Verdict",
         description="The overall verdict on the document's quality."
@@ -58,4 +96,62 @@ class RefinementPlan(BaseModel):
         default=None,
         alias="Refined Document Sections",
         description="A list of sections to be updated with new content."
-    )
\ No newline at end of file
+    )
+
+# Claves de JSON Schema que el `responseSchema` de Gemini (subconjunto de OpenAPI) no acepta.
+_UNSUPPORTED_SCHEMA_KEYS = {"title", "default", "$defs"}
+
+def _to_gemini_schema(node: Any, defs: Dict[str, Any]) -> Any:
+    """
+    Convierte un nodo de JSON Schema al formato de `responseSchema`:
+    resuelve las referencias `$ref` en línea y traduce `Optional[...]` a `nullable`.
+    """
+    if isinstance(node, list):
+        return [_to_gemini_schema(item, defs) for item in node]
+    if not isinstance(node, dict):
+        return node
+    if "$ref" in node:
+        # Las claves junto al `$ref` (p. ej. la descripción del campo) prevalecen sobre la definición.
+        siblings = {key: value for key, value in node.items() if key != "$ref"}
+        return _to_gemini_schema({**defs[node["$ref"].split("/")[-1]], **siblings}, defs)
+
+    variants = node.get("anyOf")
+    if variants and {"type": "null"} in variants:
+        non_null = [variant for variant in variants if variant != {"type": "null"}]
+        if len(non_null) == 1:
+            merged = {key: value for key, value in node.items() if key != "anyOf"}
+            merged.update(non_null[0])
+            converted = _to_gemini_schema(merged, defs)
+            converted["nullable"] = True
+            return converted
+
+    # Las docstrings de los modelos son notas internas, no instrucciones para el LLM.
+    skipped = _UNSUPPORTED_SCHEMA_KEYS | ({"description"} if "properties" in node else set())
+    converted = {
+        key: _to_gemini_schema(value, defs)
+        for key, value in node.items()
+        if key not in skipped
+    }
+    if "properties" in converted:
+        # Gemini genera las propiedades en este orden, igual que el ejemplo del prompt.
+        converted["propertyOrdering"] = list(converted["properties"])
+    return converted
+
+def gemini_response_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """Genera el `responseSchema` de Gemini a partir de un modelo Pydantic (usando los alias)."""
+    json_schema = model.model_json_schema(by_alias=True)
+    return _to_gemini_schema(json_schema, json_schema.get("$defs", {}))
+
+# Se calcula una sola vez: el esquema no cambia durante la ejecución.
+REFINEMENT_PLAN_RESPONSE_SCHEMA = gemini_response_schema(RefinementPlan)
+
+# Validador de `RefinementPlan` construido una sola vez al importar, compartido por todas las llamadas.
+REFINEMENT_PLAN_ADAPTER = TypeAdapter(RefinementPlan)
+
+def parse_plan(raw: Union[str, bytes]) -> RefinementPlan:
+    """
+    Parsea el JSON del plan (con orjson si está instalado) y lo valida con el adaptador compartido.
+    Lanza ValueError si no es JSON válido, o ValidationError (subclase de ValueError) si no cumple el esquema.
+    """
+    data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    return REFINEMENT_PLAN_ADAPTER.validate_python(data)
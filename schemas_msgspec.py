@@ -0,0 +1,38 @@
+import sys
+import msgspec
+from typing import List, Optional
+
+from schemas import IssueType, VerdictType
+
+# Espejo de los modelos de schemas.py como msgspec.Struct. Se usa solo para
+# decodificar el plan de refinamiento rápidamente; si falla, el agente recurre
+# a Pydantic, que sigue siendo el modelo de referencia y reporta los errores.
+
+class FindingMsg(msgspec.Struct):
+    """Equivalente de `Finding`, con los mismos alias que genera el LLM."""
+    location: str
+    issue: str
+    classification: IssueType = msgspec.field(name="Issue Classification")
+
+    def __post_init__(self):
+        # Igual que el validador de `Finding`: los títulos se internan.
+        self.location = sys.intern(self.location)
+
+class RefinedSectionMsg(msgspec.Struct):
+    """Equivalente de `RefinedSection`."""
+    section_title: str
+    content: str
+
+    def __post_init__(self):
+        self.section_title = sys.intern(self.section_title)
+
+class RefinementPlanMsg(msgspec.Struct):
+    """Equivalente de `RefinementPlan`."""
+    final_verdict: VerdictType = msgspec.field(name="Final Verdict")
+    summary_of_findings: List[FindingMsg] = msgspec.field(name="Summary of Findings")
+    refined_sections: Optional[List[RefinedSectionMsg]] = msgspec.field(
+        default=None, name="Refined Document Sections"
+    )
+
+# El decodificador se construye una sola vez y se reutiliza en cada ciclo.
+REFINEMENT_PLAN_DECODER = msgspec.json.Decoder(RefinementPlanMsg)